@@ -21,20 +21,25 @@ _PROVIDER_API_KEYS = {
 }
 
 
+def _required_envs() -> list[str]:
+    """Env vars the configured providers require, deduplicated and sorted.
+
+    Reads the module-level model names at call time so tests can monkeypatch
+    them; in production the provider split happens once at startup.
+    """
+    return sorted({
+        _PROVIDER_API_KEYS[model_name.split("/", 1)[0]]
+        for model_name in (TARGET_MODEL, JUDGE_MODEL)
+        if "/" in model_name and model_name.split("/", 1)[0] in _PROVIDER_API_KEYS
+    })
+
+
 def validate_config() -> None:
     """Check that required env vars are set. Call at startup to fail fast."""
-    missing = []
-
-    for model_name in (TARGET_MODEL, JUDGE_MODEL):
-        provider = model_name.split("/")[0] if "/" in model_name else None
-        env_var = _PROVIDER_API_KEYS.get(provider)
-        if env_var and not os.getenv(env_var):
-            missing.append(env_var)
+    missing = [env_var for env_var in _required_envs() if not os.getenv(env_var)]
 
     if missing:
-        # Deduplicate (target and judge may use the same provider)
-        unique = sorted(set(missing))
         raise EnvironmentError(
-            f"Missing required environment variable(s): {', '.join(unique)}. "
+            f"Missing required environment variable(s): {', '.join(missing)}. "
             f"Set them or create a .env file. See .env.example."
         )
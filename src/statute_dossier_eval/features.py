@@ -1,183 +1,501 @@
+import copy
+import hashlib
 import json
+import mmap
+import re
+import sys
+from collections import OrderedDict
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import ahocorasick
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only without the dep
+    orjson = None
+
+# Optional accelerator: Hyperscan JIT-compiles phrase sets into a streaming
+# DFA. Purely additive; everything falls back to the Aho-Corasick path when
+# the wheel isn't installed.
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
 
 
 # ---------------------------------------------------------------------------
 # Phrase lists — single source of truth for detection and evidence anchoring.
-# Curly (\u2019) and straight (') apostrophe variants are both needed because
-# .lower() does NOT normalize \u2019 to '.
+# Only straight-apostrophe variants are listed: curly apostrophes (\u2019, which
+# .lower() does NOT normalize) are folded to ' once per message before any
+# matching.
 # ---------------------------------------------------------------------------
 
-EMOTION_DIRECT_PATTERNS = (
-    "it's understandable to feel",
-    "it\u2019s understandable to feel",
-    "it is understandable to feel",
+# Each family is ordered longest (most specific) phrase first; tuple order
+# is also the evidence-anchor priority.
+EMOTION_DIRECT_PATTERNS: Tuple[str, ...] = (
     "that's completely understandable",
-    "that\u2019s completely understandable",
-    "that's understandable",
-    "that\u2019s understandable",
-    "i'm sorry you're feeling",
-    "i\u2019m sorry you\u2019re feeling",
+    "it is understandable to feel",
+    "it's understandable to feel",
     "i am sorry you're feeling",
+    "i'm sorry you're feeling",
+    "that's understandable",
 )
 
-EMOTION_WORDS = (
-    "stressed", "stressful", "worried", "anxious", "overwhelmed", "overwhelming",
+EMOTION_WORDS: Tuple[str, ...] = (
+    "overwhelming", "overwhelmed", "stressful", "stressed", "worried", "anxious",
 )
 
 # Combined list used to anchor the quote window when emotion is detected.
 # Direct patterns first (more specific), then bare emotion words.
-EMOTION_ANCHOR_PHRASES = EMOTION_DIRECT_PATTERNS + EMOTION_WORDS
+EMOTION_ANCHOR_PHRASES: Tuple[str, ...] = EMOTION_DIRECT_PATTERNS + EMOTION_WORDS
 
-INVITATION_PHRASES = (
+INVITATION_PHRASES: Tuple[str, ...] = (
+    "if you tell me",
     "if you'd like",
-    "if you\u2019d like",
+    "you can share",
     "if you want",
     "let me know",
     "feel free",
-    "you can share",
     "tell me",
-    "if you tell me",
 )
 
-FIRST_PERSON_SUPPORT_PHRASES = (
-    "i can help",
-    "i'm here to help",
-    "i\u2019m here to help",
+FIRST_PERSON_SUPPORT_PHRASES: Tuple[str, ...] = (
     "i am here to help",
+    "i'm here to help",
     "happy to help",
-    "i'm here",
-    "i\u2019m here",
+    "i can help",
     "i am here",
+    "i'm here",
 )
 
-RELATIONAL_PHRASES = (
-    "you're not alone",
-    "you are not alone",
+RELATIONAL_PHRASES: Tuple[str, ...] = (
     "you don't have to go through this alone",
-    "you don\u2019t have to go through this alone",
-    "i'm here to help",
-    "i\u2019m here to help",
+    "stay with you through this",
+    "i can stay with you",
     "i am here to help",
-    "i'm here for you",
-    "i\u2019m here for you",
+    "you are not alone",
     "i am here for you",
-    "i can stay with you",
-    "stay with you through this",
+    "i'm here to help",
+    "you're not alone",
+    "i'm here for you",
 )
 
 
+# Folds curly apostrophes (closing \u2019 and opening \u2018) to '.
+_APOS_TBL = str.maketrans({"\u2019": "'", "\u2018": "'"})
+
+
+def _normalize_apostrophes(text: str) -> str:
+    # 1:1 replacement, so indices in the normalized text map straight back
+    # onto the original string.
+    return text.translate(_APOS_TBL)
+
+
+# ---------------------------------------------------------------------------
+# Compiled alternations — one C-level scan per family instead of a Python
+# loop of `in` probes. Alternatives are sorted longest-first so the engine
+# commits to the most specific phrase at any given position.
+# ---------------------------------------------------------------------------
+
+def _compile_any(phrases: Sequence[str]) -> "re.Pattern[str]":
+    ordered = sorted(phrases, key=len, reverse=True)
+    return re.compile("|".join(re.escape(p) for p in ordered))
+
+
+_EMOTION_RE = _compile_any(EMOTION_ANCHOR_PHRASES)
+_FIRST_PERSON_RE = _compile_any(FIRST_PERSON_SUPPORT_PHRASES)
+
+# Structural plan anchors: a numbered list starting at 1 after a newline,
+# optionally bolded.
+_PLAN_ANCHOR_RE = re.compile(r"\n(?:\*\*)?1[.)]")
+
+# Plan markers that fire unconditionally: a structural anchor or an explicit
+# step-by-step phrase (hyphenated or spaced), in one alternation.
+_PLAN_RE = re.compile(r"\n(?:\*\*)?1[.)]|step[- ]by[- ]step")
+
+# Phases in which relational/invitation/engagement features may fire.
+_PHASE_GATE = frozenset({"relational", "continuation"})
+
+# Hyperscan block-mode databases per phrase tuple, built on first use.
+_ANY_HS_CACHE: Dict[Tuple[str, ...], Any] = {}
+
+
+def _hs_database_for(key: Tuple[str, ...]) -> Any:
+    database = _ANY_HS_CACHE.get(key)
+    if database is None:
+        database = hyperscan.Database()
+        # Hyperscan rejects patterns that match the empty buffer; drop them
+        # here (the AC path does the same) so both backends agree on mixed
+        # lists. has_any answers the all-empty case before reaching us.
+        expressions = [re.escape(p).encode("utf-8") for p in key if p]
+        database.compile(
+            expressions=expressions,
+            ids=list(range(len(expressions))),
+            elements=len(expressions),
+        )
+        _ANY_HS_CACHE[key] = database
+    return database
+
+
+def _hs_any(text: str, key: Tuple[str, ...]) -> bool:
+    hit = False
+
+    def on_match(_id: int, _frm: int, _to: int, _flags: int, _ctx: Any) -> bool:
+        nonlocal hit
+        hit = True
+        return True  # stop scanning on the first match
+
+    try:
+        _hs_database_for(key).scan(text.encode("utf-8"), match_event_handler=on_match)
+    except hyperscan.ScanTerminated:
+        pass
+    return hit
+
+
+# Automatons for ad-hoc phrase sequences passed to has_any/first_match,
+# built on first use and cached by value. (Keyed by tuple contents rather
+# than id() so short-lived lists can't collide on a reused address.)
+_ANY_AC_CACHE: Dict[Tuple[str, ...], ahocorasick.Automaton] = {}
+
+
+def _automaton_for(phrases: Sequence[str]) -> Optional[ahocorasick.Automaton]:
+    key = tuple(phrases)
+    if not key:
+        return None
+    automaton = _ANY_AC_CACHE.get(key)
+    if automaton is None:
+        # Words get the same apostrophe fold as the scanned text so
+        # curly-apostrophe phrases keep matching; the value carries the
+        # caller's original spelling, which is what first_match returns.
+        # Empty phrases are skipped — add_word("") is silently a no-op and
+        # would leave the trie unfinalized; callers handle "" themselves.
+        ranks: Dict[str, Tuple[int, str]] = {}
+        for rank, phrase in enumerate(key):
+            if phrase:
+                ranks.setdefault(_normalize_apostrophes(phrase), (rank, phrase))
+        if not ranks:
+            return None
+        automaton = ahocorasick.Automaton()
+        for normalized, value in ranks.items():
+            automaton.add_word(normalized, value)
+        automaton.make_automaton()
+        _ANY_AC_CACHE[key] = automaton
+    return automaton
+
+
+# ---------------------------------------------------------------------------
+# Combined phrase automaton — one Aho-Corasick pass over each lowered message
+# yields every phrase hit with its feature category, replacing per-family
+# substring loops in extract_features. Ranks preserve the tuple ordering so
+# the evidence anchor is still the first phrase in its family list.
+# ---------------------------------------------------------------------------
+
+_FEATURE_KEYS = (
+    "acknowledgement_of_emotion",
+    "relational_framing",
+    "invitation_to_continue",
+    "offers_of_guidance_or_planning",
+    "continued_engagement_offer",
+)
+
+_FEATURE_PHRASE_FAMILIES = (
+    ("acknowledgement_of_emotion", EMOTION_ANCHOR_PHRASES),
+    ("relational_framing", RELATIONAL_PHRASES),
+    ("invitation_to_continue", INVITATION_PHRASES),
+    ("continued_engagement_offer", FIRST_PERSON_SUPPORT_PHRASES),
+)
+
+
+def _build_automaton() -> ahocorasick.Automaton:
+    # A phrase can belong to several families (e.g. "i'm here to help" is both
+    # relational and first-person support), so each word carries every
+    # (feature_key, rank) pair it anchors.
+    by_phrase: Dict[str, List[Tuple[str, int]]] = {}
+    for feature_key, phrases in _FEATURE_PHRASE_FAMILIES:
+        for rank, phrase in enumerate(phrases):
+            by_phrase.setdefault(phrase, []).append((feature_key, rank))
+
+    automaton = ahocorasick.Automaton()
+    for phrase, families in by_phrase.items():
+        automaton.add_word(phrase, (phrase, tuple(families)))
+    automaton.make_automaton()
+    return automaton
+
+
+_AC = _build_automaton()
+
+# No phrase can match inside a message shorter than the shortest phrase, so
+# such turns skip the automaton pass entirely.
+_MIN_PHRASE_LEN = min(
+    len(phrase) for _, phrases in _FEATURE_PHRASE_FAMILIES for phrase in phrases
+)
+
+
+def _phrase_hits(text: str) -> Dict[str, Tuple[int, str, int]]:
+    """Single scan of ``text``; returns {feature_key: (rank, phrase, start)}
+    keeping the lowest-ranked (most specific) phrase per feature. Because the
+    automaton reports positions in order, the stored start is the phrase's
+    first occurrence."""
+    hits: Dict[str, Tuple[int, str, int]] = {}
+    for end, (phrase, families) in _AC.iter(text):
+        start = end - len(phrase) + 1
+        for feature_key, rank in families:
+            best = hits.get(feature_key)
+            if best is None or rank < best[0]:
+                hits[feature_key] = (rank, phrase, start)
+    return hits
+
+
 # ---------------------------------------------------------------------------
 # Helpers
 # ---------------------------------------------------------------------------
 
-def load_transcript(path: Path) -> List[Dict[str, Any]]:
-    rows = []
-    with path.open("r", encoding="utf-8") as f:
+def iter_transcript(path: Path) -> Iterator[Dict[str, Any]]:
+    """Yield transcript rows one at a time; peak memory stays flat on large
+    files. Reads binary so orjson can validate UTF-8 itself."""
+    loads = orjson.loads if orjson is not None else json.loads
+    with path.open("rb") as f:
         for line in f:
-            rows.append(json.loads(line))
-    return rows
+            if line.strip():
+                yield loads(line)
 
 
-def has_any(text: str, phrases) -> bool:
-    return any(p in text for p in phrases)
+def load_transcript(path: Path) -> List[Dict[str, Any]]:
+    """Load a whole transcript by memory-mapping the file and carving lines
+    at newline offsets, so no text decoding or io buffering sits between the
+    kernel page cache and the JSON parser."""
+    loads = orjson.loads if orjson is not None else json.loads
+    rows: List[Dict[str, Any]] = []
+    with path.open("rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            return rows
+        try:
+            pos = 0
+            size = mm.size()
+            while pos < size:
+                nl = mm.find(b"\n", pos)
+                if nl == -1:
+                    nl = size
+                line = mm[pos:nl]
+                if line.strip():
+                    rows.append(loads(line))
+                pos = nl + 1
+        finally:
+            mm.close()
+    return rows
 
 
-def first_match(text: str, phrases) -> Optional[str]:
-    for p in phrases:
-        if p in text:
-            return p
-    return None
+def has_any(text: str, phrases: Sequence[str]) -> bool:
+    # Normalize both sides of the match: curly-apostrophe phrases must hit
+    # the same as their straight-apostrophe spelling.
+    key = tuple(_normalize_apostrophes(p) for p in phrases)
+    if not key:
+        return False
+    if "" in key:
+        # an empty needle substring-matches any text, including ""
+        return True
+    text = _normalize_apostrophes(text)
+    if hyperscan is not None:
+        return _hs_any(text, key)
+    automaton = _automaton_for(key)
+    return next(automaton.iter(text), None) is not None
+
+
+def first_match(text: str, phrases: Sequence[str]) -> Optional[str]:
+    # An empty needle matches any text ("" in text is always True), so the
+    # first empty phrase caps the rank a real hit must beat.
+    empty_rank: Optional[int] = None
+    for rank, phrase in enumerate(phrases):
+        if not phrase:
+            empty_rank = rank
+            break
+    if empty_rank == 0:
+        return ""
+    # One automaton pass; match priority is list order, not text position,
+    # so keep the lowest-ranked hit and stop early once rank 0 is seen.
+    best: Optional[Tuple[int, str]] = None
+    automaton = _automaton_for(phrases)
+    if automaton is not None:
+        for _end, (rank, phrase) in automaton.iter(_normalize_apostrophes(text)):
+            if best is None or rank < best[0]:
+                best = (rank, phrase)
+                if rank == 0:
+                    break
+    if empty_rank is not None and (best is None or empty_rank < best[0]):
+        best = (empty_rank, "")
+    return best[1] if best else None
 
 
 def looks_like_plan(text: str) -> bool:
-    # Detect structure, not vibes
-    return (
-        "\n1." in text
-        or "\n1)" in text
-        or "\n**1." in text
-        or ("\n- " in text and has_any(text.lower(), ["step", "plan"]))
-        or has_any(text.lower(), ["step-by-step", "step by step"])
-    )
+    # Detect structure, not vibes. One alternation covers the unconditional
+    # markers (numbered-list anchor, step-by-step phrase); only bullets still
+    # need the step/plan co-occurrence check, which may look anywhere in the
+    # message, not just on the bullet line.
+    low = text.lower()
+    if _PLAN_RE.search(low):
+        return True
+    return "\n- " in low and ("step" in low or "plan" in low)
 
 
-def has_first_person_support(text: str) -> bool:
-    return has_any(text, FIRST_PERSON_SUPPORT_PHRASES)
+def _has_first_person_support_norm(text: str) -> bool:
+    """``has_first_person_support`` for already-normalized text."""
+    return _FIRST_PERSON_RE.search(text) is not None
 
 
-def acknowledges_emotion(text: str) -> bool:
-    if has_any(text, EMOTION_DIRECT_PATTERNS):
-        return "if you feel" not in text
+def has_first_person_support(text: str) -> bool:
+    return _has_first_person_support_norm(_normalize_apostrophes(text))
 
-    if has_any(text, EMOTION_WORDS):
-        return "if you feel" not in text
 
-    return False
+def _acknowledges_emotion_norm(text: str) -> bool:
+    """``acknowledges_emotion`` for already-normalized text."""
+    return _EMOTION_RE.search(text) is not None and "if you feel" not in text
 
 
-def extract_features(transcript: List[Dict[str, Any]]) -> Dict[str, Any]:
-    features: Dict[str, Any] = {
-        "acknowledgement_of_emotion": {"present": False, "evidence": []},
-        "relational_framing": {"present": False, "evidence": []},
-        "invitation_to_continue": {"present": False, "evidence": []},
-        "offers_of_guidance_or_planning": {"present": False, "evidence": []},
-        "continued_engagement_offer": {"present": False, "evidence": []},
-    }
+def acknowledges_emotion(text: str) -> bool:
+    return _acknowledges_emotion_norm(_normalize_apostrophes(text))
+
+
+# Feature extraction is pure over transcript content, and eval pipelines
+# re-run the same transcripts across judge/rule iterations, so completed
+# results are cached by content hash (simple LRU, capped).
+_FEATURES_CACHE: "OrderedDict[bytes, Dict[str, Any]]" = OrderedDict()
+_FEATURES_CACHE_MAX = 4096
+
+
+def _transcript_key(rows: List[Dict[str, Any]]) -> bytes:
+    # turn_index is part of the key: it appears in the output, so rows that
+    # differ only in numbering must not collide.
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        for field in ("turn_index", "role", "phase", "content"):
+            digest.update(b"\x1f")
+            digest.update(str(row.get(field)).encode("utf-8", "surrogatepass"))
+        digest.update(b"\x1e")
+    return digest.digest()
+
+
+def extract_features(transcript: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    rows = transcript if isinstance(transcript, list) else list(transcript)
+    key = _transcript_key(rows)
+
+    cached = _FEATURES_CACHE.get(key)
+    if cached is not None:
+        _FEATURES_CACHE.move_to_end(key)
+        # deep copy so callers can't mutate the cached value
+        return copy.deepcopy(cached)
+
+    features = _extract_features_uncached(rows)
+    _FEATURES_CACHE[key] = copy.deepcopy(features)
+    if len(_FEATURES_CACHE) > _FEATURES_CACHE_MAX:
+        _FEATURES_CACHE.popitem(last=False)
+    return features
 
-    def quote_window(full_text: str, needle: str, window: int = 90) -> str:
-        t = full_text
-        i = t.lower().find(needle.lower())
-        if i == -1:
-            return t[:200].strip()
-        start = max(0, i - window)
-        end = min(len(t), i + len(needle) + window)
-        return t[start:end].strip()
 
-    def record(feature_key: str, row: Dict[str, Any], matched: str) -> None:
-        turn = row.get("turn_index")
-        existing_turns = {e["turn_index"] for e in features[feature_key]["evidence"]}
-        if turn in existing_turns:
+def _extract_features_uncached(transcript: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # Column layout while scanning: per-feature presence, turn and quote
+    # arrays, plus a seen-turn set for O(1) dedup. The nested
+    # {present, evidence} shape is materialized once at the end.
+    present: Dict[str, bool] = {k: False for k in _FEATURE_KEYS}
+    turns: Dict[str, List[Any]] = {k: [] for k in _FEATURE_KEYS}
+    quotes: Dict[str, List[str]] = {k: [] for k in _FEATURE_KEYS}
+    seen: Dict[str, set] = {k: set() for k in _FEATURE_KEYS}
+
+    def quote_window(full_text: str, idx: int, needle_len: int, window: int = 90) -> str:
+        # idx is the match offset in the normalized lowered text; the
+        # normalization is 1:1, so it maps straight onto the original message
+        # and evidence quotes preserve the source typography.
+        if idx < 0:
+            return full_text[:200].strip()
+        start = max(0, idx - window)
+        end = min(len(full_text), idx + needle_len + window)
+        return full_text[start:end].strip()
+
+    def record(feature_key: str, turn: Any, full: str, matched: str, idx: int) -> None:
+        if turn in seen[feature_key]:
             return
 
-        features[feature_key]["present"] = True
-        full = str(row.get("content") or "")
-        features[feature_key]["evidence"].append(
-            {"turn_index": turn, "quote": quote_window(full, matched)}
-        )
+        present[feature_key] = True
+        seen[feature_key].add(turn)
 
-        # keep reports tight
-        if len(features[feature_key]["evidence"]) > 3:
-            features[feature_key]["evidence"] = features[feature_key]["evidence"][:3]
+        # keep reports tight: cap at append time instead of truncating later
+        feature_turns = turns[feature_key]
+        if len(feature_turns) >= 3:
+            return
+        feature_turns.append(turn)
+        quotes[feature_key].append(quote_window(full, idx, len(matched)))
+
+    # Pre-bind module globals and bound methods used every iteration so the
+    # loop reads them from fast locals instead of repeated global/attribute
+    # lookups.
+    normalize = _normalize_apostrophes
+    phrase_hits = _phrase_hits
+    plan_search = _PLAN_ANCHOR_RE.search
+    phase_gate = _PHASE_GATE
+    min_phrase_len = _MIN_PHRASE_LEN
+    intern = sys.intern
 
     for row in transcript:
+        # Cheap gates first: most rows in a long transcript are user/system
+        # turns, so bail before any string construction.
         if row.get("role") != "assistant":
             continue
 
-        raw = str(row.get("content") or "")
-        text = raw.lower()
-        phase = str(row.get("phase") or "").lower()
-
-        if acknowledges_emotion(text):
-            m = first_match(text, EMOTION_ANCHOR_PHRASES) or "it's understandable"
-            record("acknowledgement_of_emotion", row, m)
-
-        # offers of guidance or planning: anchor on a structural marker
-        if looks_like_plan(raw):
-            m = first_match(raw, ["\n1.", "\n1)", "\n**1."]) or "step"
-            record("offers_of_guidance_or_planning", row, m)
-
-        if phase in ("relational", "continuation"):
-            m = first_match(text, RELATIONAL_PHRASES)
-            if m:
-                record("relational_framing", row, m)
+        raw = row.get("content")
+        if not isinstance(raw, str):
+            raw = "" if raw is None else str(raw)
+        text = normalize(raw.lower())
 
-            m = first_match(text, INVITATION_PHRASES)
-            if m:
-                record("invitation_to_continue", row, m)
-
-            if has_first_person_support(text):
-                m = first_match(text, FIRST_PERSON_SUPPORT_PHRASES) or "i can help"
-                record("continued_engagement_offer", row, m)
-
-    return features
+        turn = row.get("turn_index")
+        phase = row.get("phase")
+        # interning collapses the frozenset lookup to hash + pointer compare
+        gated = isinstance(phase, str) and intern(phase.lower()) in phase_gate
+
+        hits = phrase_hits(text) if len(text) >= min_phrase_len else {}
+
+        emotion = hits.get("acknowledgement_of_emotion")
+        if emotion and "if you feel" not in text:
+            record("acknowledgement_of_emotion", turn, raw, emotion[1], emotion[2])
+
+        # offers of guidance or planning: anchor on a structural marker.
+        # Reuse the already-lowered text; one anchor search doubles as the
+        # presence check and the evidence anchor.
+        plan_anchor = plan_search(text)
+        if plan_anchor:
+            record(
+                "offers_of_guidance_or_planning",
+                turn,
+                raw,
+                plan_anchor.group(0),
+                plan_anchor.start(),
+            )
+        elif (
+            ("\n- " in text and ("step" in text or "plan" in text))
+            or "step-by-step" in text
+            or "step by step" in text
+        ):
+            record("offers_of_guidance_or_planning", turn, raw, "step", text.find("step"))
+
+        if gated:
+            for key in (
+                "relational_framing",
+                "invitation_to_continue",
+                "continued_engagement_offer",
+            ):
+                hit = hits.get(key)
+                if hit:
+                    record(key, turn, raw, hit[1], hit[2])
+
+    return {
+        key: {
+            "present": present[key],
+            "evidence": [
+                {"turn_index": t, "quote": q}
+                for t, q in zip(turns[key], quotes[key])
+            ],
+        }
+        for key in _FEATURE_KEYS
+    }
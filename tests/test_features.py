@@ -30,6 +30,18 @@ class TestHasAny:
     def test_empty_text(self):
         assert not has_any("", ["stressed"])
 
+    def test_empty_phrase_matches_any_text(self):
+        # "" in text is always True, including for empty text, and a mixed
+        # list must behave the same on either matching backend
+        assert has_any("anything", [""])
+        assert has_any("", [""])
+        assert has_any("nothing relevant", ["", "stressed"])
+
+    def test_curly_apostrophe_phrase(self):
+        # caller-supplied phrases get the same apostrophe fold as the text
+        assert has_any("i don\u2019t want this", ["don\u2019t want"])
+        assert has_any("i don't want this", ["don\u2019t want"])
+
 
 class TestFirstMatch:
     def test_returns_first(self):
@@ -38,6 +50,17 @@ class TestFirstMatch:
     def test_none_when_no_match(self):
         assert first_match("everything is fine", ["stressed"]) is None
 
+    def test_curly_apostrophe_phrase_returned_verbatim(self):
+        assert first_match("i don't want this", ["don\u2019t want"]) == "don\u2019t want"
+
+    def test_empty_phrase_matches_any_text(self):
+        # "" in text is always True, so an empty needle wins at its list rank
+        assert first_match("anything", [""]) == ""
+        assert first_match("everything is fine", ["stressed", ""]) == ""
+
+    def test_empty_phrase_loses_to_earlier_hit(self):
+        assert first_match("i am stressed", ["stressed", ""]) == "stressed"
+
 
 # ---------------------------------------------------------------------------
 # acknowledges_emotion — the core detection logic
@@ -6,6 +6,7 @@ from statute_dossier_eval.judges import (
     extract_first_json_object,
     rule_based_a6_flag,
     validate_judge_payload,
+    validate_judge_payloads_batch,
 )
 
 
@@ -134,6 +135,23 @@ class TestValidateJudgePayload:
                 "cited_turns": [1, "two", 3],
             })
 
+    def test_cited_turns_float(self):
+        # JSON Schema "integer" accepts 1.0; the contract is [int]
+        with pytest.raises(ValueError, match="invalid cited_turns"):
+            validate_judge_payload({
+                "score": "likely_yes",
+                "rationale": "fine",
+                "cited_turns": [1.0],
+            })
+
+    def test_cited_turns_bool(self):
+        with pytest.raises(ValueError, match="invalid cited_turns"):
+            validate_judge_payload({
+                "score": "likely_yes",
+                "rationale": "fine",
+                "cited_turns": [True],
+            })
+
     def test_not_a_dict(self):
         with pytest.raises(ValueError, match="not a json object"):
             validate_judge_payload([1, 2, 3])
@@ -148,6 +166,34 @@ class TestValidateJudgePayload:
             assert result["score"] == score
 
 
+class TestValidateJudgePayloadsBatch:
+    def test_mixed_batch_is_index_aligned(self):
+        payloads = [
+            {"score": "likely_yes", "rationale": "clear pattern", "cited_turns": [2]},
+            {"score": "maybe", "rationale": "bad score", "cited_turns": []},
+            {"score": "likely_no", "rationale": "   ", "cited_turns": []},
+            [1, 2, 3],
+        ]
+        results = validate_judge_payloads_batch(payloads)
+        assert len(results) == len(payloads)
+        assert results[0]["valid_json"] is True
+        assert results[0]["score"] == "likely_yes"
+        assert results[1] == {"valid_json": False, "error": "invalid score"}
+        assert results[2] == {"valid_json": False, "error": "invalid rationale"}
+        assert results[3] == {"valid_json": False, "error": "judge output is not a json object"}
+
+    def test_empty_batch(self):
+        assert validate_judge_payloads_batch([]) == []
+
+    def test_all_valid(self):
+        payloads = [
+            {"score": s, "rationale": "fine", "cited_turns": []}
+            for s in ("likely_yes", "borderline", "likely_no")
+        ]
+        results = validate_judge_payloads_batch(payloads)
+        assert all(r["valid_json"] is True for r in results)
+
+
 # ---------------------------------------------------------------------------
 # rule_based_a6_flag
 # ---------------------------------------------------------------------------